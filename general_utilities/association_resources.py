@@ -5,6 +5,7 @@ import pandas as pd
 import pandas.core.series
 
 from pathlib import Path
+from functools import lru_cache
 from typing import List, Union, Tuple, IO
 
 from dxpy import DXSearchError
@@ -352,22 +353,42 @@ def find_index(parent_file: Union[dxpy.DXFile, dict], index_suffix: str) -> dxpy
 def find_dxlink(name: str, folder: str) -> dict:
     """This method is a simple wrapper for dxpy.find_one_data_object() for ease of repetitive use
 
+    Searches are cached by name, folder, and project (see :func:`_find_one_file`), so asking for the same file more
+    than once only queries the DNANexus API the first time.
+
     :param name: EXACT name of the file to be searched for (without path information)
     :param folder: EXACT name of the folder where this should be found
     :return: A dxpy.dxlink() representation of the file
     """
 
     try:
-        dxlink = dxpy.dxlink(dxpy.find_one_data_object(name=name,
-                                                       classname='file',
-                                                       folder=folder,
-                                                       project=dxpy.PROJECT_CONTEXT_ID,
-                                                       name_mode='exact',
-                                                       zero_ok=False))
+        found_file = _find_one_file(name, folder, dxpy.PROJECT_CONTEXT_ID)
     except DXSearchError:
         raise FileNotFoundError(f'File – {folder}/{name} – not found during imputation data search!')
 
-    return dxlink
+    # Copy so that a caller modifying the returned link cannot alter the cached search result
+    return dxpy.dxlink(dict(found_file))
+
+
+@lru_cache(maxsize=None)
+def _find_one_file(name: str, folder: str, project: str) -> dict:
+    """Cached search for a single file on the DNANexus platform.
+
+    Failed searches raise and are therefore not cached. Call `_find_one_file.cache_clear()` if files are expected to
+    change during a run.
+
+    :param name: EXACT name of the file to be searched for (without path information)
+    :param folder: EXACT name of the folder where this should be found
+    :param project: The project ID to search in
+    :return: The dict returned by :func:`dxpy.find_one_data_object()` (keys of 'id' and 'project')
+    """
+
+    return dxpy.find_one_data_object(name=name,
+                                     classname='file',
+                                     folder=folder,
+                                     project=project,
+                                     name_mode='exact',
+                                     zero_ok=False)
 
 
 def bgzip_and_tabix(file_path: Path, comment_char: str = None, skip_row: int = None,
@@ -1,12 +1,15 @@
 import re
-import csv
 import dxpy
 
 from pathlib import Path
-from typing import Set, List
+from typing import Set, List, Iterator
 
 from general_utilities.mrc_logger import MRCLogger
 from general_utilities.job_management.command_executor import CommandExecutor
+from general_utilities.job_management.thread_utility import ThreadUtility
+
+# Matches the line in plink2 stdout that reports the number of samples remaining after filtering
+PLINK_COUNT_PATTERN = re.compile(r'(\d+) samples \(\d+ females, \d+ males; \d+ founders\) remaining after')
 
 
 class GeneticsLoader:
@@ -60,31 +63,52 @@ class GeneticsLoader:
 
         # Now grab all genetic data that I have in the folder /project_resources/genetics/
         Path('genetics/').mkdir(exist_ok=True)  # This is for legacy reasons to make sure all tests work...
-        dxpy.download_dxfile(self._bed_file.get_id(), 'genetics/UKBB_470K_Autosomes_QCd.bed')
-        dxpy.download_dxfile(self._bim_file.get_id(), 'genetics/UKBB_470K_Autosomes_QCd.bim')
-        dxpy.download_dxfile(self._fam_file.get_id(), 'genetics/UKBB_470K_Autosomes_QCd.fam')
+
+        # These downloads are independent of each other and network-bound, so run them concurrently
+        thread_utility = ThreadUtility(error_message='A genetic data download thread failed')
+        thread_utility.launch_job(dxpy.download_dxfile,
+                                  dxid=self._bed_file.get_id(), filename='genetics/UKBB_470K_Autosomes_QCd.bed')
+        thread_utility.launch_job(dxpy.download_dxfile,
+                                  dxid=self._bim_file.get_id(), filename='genetics/UKBB_470K_Autosomes_QCd.bim')
+        thread_utility.launch_job(dxpy.download_dxfile,
+                                  dxid=self._fam_file.get_id(), filename='genetics/UKBB_470K_Autosomes_QCd.fam')
 
         if self._low_mac_list is not None:
-            dxpy.download_dxfile(self._low_mac_list.get_id(), 'genetics/UKBB_470K_Autosomes_QCd.low_MAC.snplist')
+            thread_utility.launch_job(dxpy.download_dxfile,
+                                      dxid=self._low_mac_list.get_id(),
+                                      filename='genetics/UKBB_470K_Autosomes_QCd.low_MAC.snplist')
+
+        thread_utility.collect_futures()
 
         self._logger.info('Genetic array data downloaded...')
 
     @staticmethod
-    def _generate_sample_set(sample_path: Path) -> Set[str]:
-        """Read a sample file and add all samples within it to a set()
+    def _iter_sample_ids(sample_path: Path) -> Iterator[str]:
+        """Lazily read the sample IDs (the ID_2 column) from a sample file
+
+        This allows sample files to be intersected without first loading every ID in the file into memory.
 
         :param sample_path: Path to a sample file
-        :return: A set containing string representations of all samples in the file passed to sample_path
+        :return: An Iterator over string representations of all samples in the file passed to sample_path
         """
 
-        sample_set = set()
         with sample_path.open('r') as sample_file:
+            # The first two lines of a sample file are always the header (ID_1 ID_2 ...) and column types (0 0 ...),
+            # so skip them once rather than checking every line
+            next(sample_file, None)
+            next(sample_file, None)
             for sample in sample_file:
-                sample = sample.rstrip().split()
-                if sample[0] != "ID_1" and sample[0] != "0":
-                    sample_set.add(sample[1])
+                yield sample.split(maxsplit=2)[1]
+
+    @classmethod
+    def _generate_sample_set(cls, sample_path: Path) -> Set[str]:
+        """Read a sample file and add all samples within it to a set()
 
-        return sample_set
+        :param sample_path: Path to a sample file
+        :return: A set containing string representations of all samples in the file passed to sample_path
+        """
+
+        return set(cls._iter_sample_ids(sample_path))
 
     def _write_union_sample(self, sample_paths: List[Path]) -> Path:
         """Merge some number of sample files into a single intersected sample file
@@ -95,23 +119,25 @@ class GeneticsLoader:
         The union sample file written by this method is NOT safe for any external tool(s) and is meant to just pass
         through the GeneticsLoader() class if required.
 
+        Sample files are processed smallest first (file size is a cheap proxy for the number of samples) so the running
+        intersection is as small as possible from the outset. If the intersection is ever empty, no further files are
+        read.
+
         :param sample_paths: a List of Paths to sample files
         :return: A Path representation of the union sample file
         """
 
-        union_samples = set()
-        for sample_path in sample_paths:
-            if len(union_samples) > 0:
-                union_samples = union_samples.intersection(self._generate_sample_set(sample_path))
-            else:
-                union_samples = self._generate_sample_set(sample_path)
+        sorted_paths = sorted(sample_paths, key=lambda sample_path: sample_path.stat().st_size)
+        union_samples = self._generate_sample_set(sorted_paths[0])
+        for sample_path in sorted_paths[1:]:
+            if len(union_samples) == 0:
+                break
+            union_samples.intersection_update(self._iter_sample_ids(sample_path))
 
         union_sample_path = Path('union.sample')
         with union_sample_path.open('w') as union_file:
-            union_file.write('ID_1 ID_2\n')
-            union_file.write('0 0\n')
-            for sample in union_samples:
-                union_file.write(f'{sample} {sample}\n')
+            union_file.write('ID_1 ID_2\n0 0\n')
+            union_file.writelines(f'{sample} {sample}\n' for sample in union_samples)
 
         return union_sample_path
 
@@ -134,25 +160,21 @@ class GeneticsLoader:
         """
 
         # 1. Read in imputed / dosage samples and get an intersection with SAMPLES_Include.txt
+        # The union sample IDs are kept (in file order) so that the file does not need to be read again when writing
+        # the remove file in step 3.
         include_path = Path('SAMPLES_Include.txt')
-        with self._union_sample.open('r') as sample_file, \
-                include_path.open('r') as include_file:
+        with include_path.open('r') as include_file:
 
-            testing_samples = set()
-            for sample in sample_file:
-                sample = sample.rstrip().split()
-                if sample[0] != "ID_1" and sample[0] != "0":
-                    testing_samples.add(sample[1])
+            union_samples = list(self._iter_sample_ids(self._union_sample))
+            testing_samples = set(union_samples)
             self._logger.info(f'{"Number of dosage / imputed samples":<65}: {len(testing_samples)}')
 
             # Genetic/covariate should be identical since we process them earlier, but just making sure here...
-            genetic_samples = set()
-            for sample in include_file:
-                sample = sample.rstrip().split()[0]
-                genetic_samples.add(sample)
+            genetic_samples = frozenset(sample.split(maxsplit=1)[0] for sample in include_file)
 
             self._logger.info(f'{"Number of .bed samples":<65}: {len(genetic_samples)}')
-            valid_samples = testing_samples.intersection(genetic_samples)
+            # valid_samples is only used for membership tests from here on, so keep it immutable
+            valid_samples = genetic_samples.intersection(testing_samples)
             self._logger.info(f'{"Number of union samples":<65}: {len(valid_samples)}')
 
         # 2. Read in the processed phenotypes/covariates file and print out a new file based on the intersection with
@@ -165,20 +187,18 @@ class GeneticsLoader:
                 new_include_path.open('w') as new_include_file, \
                 new_combo_path.open('w') as new_formatted_combo_file:
 
-            # Here we just take this iteration opportunity to add in the 'array_batch' covariate for imputed data
-            base_covar_reader = csv.DictReader(formatted_combo_file, delimiter=' ')
+            # We are only filtering rows here, not modifying them, so lines are copied as-is rather than parsed into
+            # (and re-written from) a dict. We only need to pull out the FID column to check if a sample is valid.
+            header = formatted_combo_file.readline()
+            new_formatted_combo_file.write(header)
+            fid_index = header.rstrip('\n').split(' ').index('FID')
+
             indv_written = 0  # Just to count the number of samples we will analyse
-            combo_writer = csv.DictWriter(new_formatted_combo_file,
-                                          fieldnames=base_covar_reader.fieldnames,
-                                          quoting=csv.QUOTE_NONE,
-                                          delimiter=' ',
-                                          lineterminator='\n')
-
-            combo_writer.writeheader()
-            for indv in base_covar_reader:
-                if indv['FID'] in valid_samples:
-                    combo_writer.writerow(indv)
-                    new_include_file.write(f'{indv["FID"]} {indv["FID"]}\n')
+            for indv in formatted_combo_file:
+                fid = indv.rstrip('\n').split(' ', fid_index + 1)[fid_index]
+                if fid in valid_samples:
+                    new_formatted_combo_file.write(indv)
+                    new_include_file.write(f'{fid} {fid}\n')
                     indv_written += 1
 
             self._logger.info(f'{"Number of INCLUDE samples":<65}: {indv_written}')
@@ -187,22 +207,17 @@ class GeneticsLoader:
         new_include_path.replace(include_path)
 
         # 3. Finally, we need to go back through the genetic data and write out samples that we need to exclude...
-        # Read in valid samples from the imputed data, crosscheck the valid covariate samples, and write the
-        # result to a new file:
+        # Take the valid samples from the imputed data (read in step 1), crosscheck the valid covariate samples, and
+        # write the result to a new file:
         # I am unsure if this is necessary for the dosage format, but going to do it again to be sure...
         remove_path = Path('SAMPLES_Remove.txt')
         new_remove_path = Path('SAMPLES_Remove.genetic_matched.txt')
-        with self._union_sample.open('r') as sample_file, \
-                new_remove_path.open('w') as remove_file:
+        with new_remove_path.open('w') as remove_file:
 
-            num_exclude = 0
-            for sample in sample_file:
-                data = sample.rstrip().split()
-                if data[1] not in valid_samples and data[0] != "ID_1" and data[0] != "0":
-                    remove_file.write(f'{data[1]} {data[1]}\n')
-                    num_exclude += 1
+            exclude_samples = [sample for sample in union_samples if sample not in valid_samples]
+            remove_file.writelines(f'{sample} {sample}\n' for sample in exclude_samples)
 
-            self._logger.info(f'{"Number of REMOVE samples":<65}: {num_exclude}')
+            self._logger.info(f'{"Number of REMOVE samples":<65}: {len(exclude_samples)}')
 
         new_remove_path.replace(remove_path)
 
@@ -226,9 +241,10 @@ class GeneticsLoader:
         # I have to do this to recover the sample information from plink
         with Path('plink_filtered.out').open('r') as plink_out:
             for line in plink_out:
-                count_matcher = re.match('(\\d+) samples \(\\d+ females, \\d+ males; \\d+ founders\) remaining after', line)
+                count_matcher = PLINK_COUNT_PATTERN.match(line)
                 if count_matcher:
                     self._logger.info(f'{"Plink individuals written":{65}}: {count_matcher.group(1)}')
+                    break  # plink only reports this count once, so no need to read the rest of the log
 
     @staticmethod
     def ingest_sparse_matrix(sparse_grm: dxpy.DXFile, sparse_grm_sample: dxpy.DXFile) -> None:
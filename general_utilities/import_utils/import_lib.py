@@ -1,13 +1,16 @@
 import csv
+import hashlib
 import tarfile
 
 import dxpy
 
 from pathlib import Path
-from typing import Union, Dict, Tuple, List, TypedDict, Optional
+from functools import lru_cache
+from typing import Union, Dict, Tuple, List, TypedDict, Optional, BinaryIO
 
 from general_utilities.association_resources import download_dxfile_by_name
 from general_utilities.job_management.command_executor import CommandExecutor
+from general_utilities.job_management.thread_utility import ThreadUtility
 from general_utilities.mrc_logger import MRCLogger
 
 LOGGER = MRCLogger().get_logger()
@@ -44,15 +47,25 @@ def process_bgen_file(chrom_bgen_index: BGENInformation, chromosome: str) -> Non
     """
 
     # First we have to download the actual data
-    bgen_index = chrom_bgen_index['index']
-    bgen_sample = chrom_bgen_index['sample']
-    bgen = chrom_bgen_index['bgen']
-    vep = chrom_bgen_index['vep']
-
-    dxpy.download_dxfile(bgen_index, f'filtered_bgen/{chromosome}.filtered.bgen.bgi')
-    dxpy.download_dxfile(bgen_sample, f'filtered_bgen/{chromosome}.filtered.sample')
-    dxpy.download_dxfile(bgen, f'filtered_bgen/{chromosome}.filtered.bgen')
-    dxpy.download_dxfile(vep, f'filtered_bgen/{chromosome}.filtered.vep.tsv.gz')
+    downloads = [(chrom_bgen_index['index'], f'filtered_bgen/{chromosome}.filtered.bgen.bgi'),
+                 (chrom_bgen_index['sample'], f'filtered_bgen/{chromosome}.filtered.sample'),
+                 (chrom_bgen_index['bgen'], f'filtered_bgen/{chromosome}.filtered.bgen'),
+                 (chrom_bgen_index['vep'], f'filtered_bgen/{chromosome}.filtered.vep.tsv.gz')]
+
+    # Describe all files in one API call and hand each description to its download. Otherwise, download_dxfile
+    # makes its own describe call per file before it can start downloading. These are the same fields that
+    # 'dx download' requests for the same purpose. Descriptions are matched to downloads on file ID rather than on
+    # position, as a mismatch would have a file downloaded using another file's parts without any error.
+    descriptions = {description['id']: description for description in
+                    dxpy.describe([dxlink for dxlink, _ in downloads], fields=['parts', 'size', 'drive', 'md5'])}
+
+    # These downloads are independent of each other and network-bound, so run them concurrently
+    thread_utility = ThreadUtility(error_message=f'A bgen download thread for chromosome {chromosome} failed')
+    for dxlink, filename in downloads:
+        file_id, _ = dxpy.get_dxlink_ids(dxlink)
+        thread_utility.launch_job(dxpy.download_dxfile, dxid=dxlink, filename=filename,
+                                  describe_output=descriptions[file_id])
+    thread_utility.collect_futures()
 
     # Make a plink-compatible sample file (the one downloaded above is in bgen sample-v2 format)
     sample_v2_to_v1(Path(f'filtered_bgen/{chromosome}.filtered.sample'))
@@ -82,25 +95,22 @@ def sample_v2_to_v1(bgen_v2: Path) -> Path:
 
     bgen_v1 = bgen_v2.with_suffix('.v1.sample')
 
-    with bgen_v2.open('r') as samp_file, \
-            bgen_v1.open('w') as fixed_samp:
+    with bgen_v2.open('r', buffering=1 << 20) as samp_file:  # 1 MiB read buffer as sample files are read in full
 
-        found_header_1 = False
-        found_header_2 = False
+        # The first two lines of a v2 sample file are always the header (ID...) and column types (0...)
+        header_1 = samp_file.readline().split(' ', 1)[0].rstrip()
+        header_2 = samp_file.readline().split(' ', 1)[0].rstrip()
+        if not header_1.startswith('ID') or header_2 != '0':
+            raise dxpy.AppError(f'Provided bgen sample file ({bgen_v2}) is not in v2 format')
 
-        for line in samp_file:
-            line = line.rstrip().split(" ")
-            if line[0].startswith('ID'):
-                found_header_1 = True
-                fixed_samp.write('ID_1 ID_2 missing sex\n')
-            elif line[0] == '0':
-                found_header_2 = True
-                fixed_samp.write('0 0 0 D\n')
-            else:
-                fixed_samp.write(f'{line[0]} {line[0]} 0 NA\n')
+        # Only the first (ID) column is needed for the v1 file, so build the whole body in one pass and write it once
+        # rather than issuing a write per sample
+        v1_body = ''.join([f'{sample} {sample} 0 NA\n' for sample in
+                           (line.partition(' ')[0].rstrip() for line in samp_file)])
 
-        if not found_header_1 or not found_header_2:
-            raise dxpy.AppError(f'Provided bgen sample file ({bgen_v2}) is not in v2 format')
+    with bgen_v1.open('w') as fixed_samp:
+        fixed_samp.write('ID_1 ID_2 missing sex\n0 0 0 D\n')
+        fixed_samp.write(v1_body)
 
     return bgen_v1.replace(bgen_v2)
 
@@ -113,29 +123,60 @@ def ingest_wes_bgen(bgen_index: dxpy.DXFile) -> Dict[str, BGENInformation]:
     chrom   vep_dxid   bgen_dxid    bgen_index_dxid   sample_dxid
     1    file-1234567890ABCDEFGH   file-0987654321ABCDEFGH   file-1234567890HGFEDCBA   file-0987654321HGFEDCBA
 
+    The parsed index is cached by file ID (see :func:`_load_bgen_index`), so asking for the same index more than once
+    only downloads it the first time.
+
     :param bgen_index: A DNANexus file reference (file-12345) pointing to a TSV-format 'dictionary' of file paths
     :return: A Dict with keys of chromosomes and values of the BGENInformation typeddict
     """
 
-    # Download the INDEX of bgen files:
-    dxpy.download_dxfile(bgen_index.get_id(), "bgen_locs.tsv")
-    # and load it into a dict:
     Path('filtered_bgen/').mkdir(exist_ok=True)  # For downloading later...
 
-    with Path('bgen_locs.tsv').open('r') as bgen_index:
-        bgen_index_csv = csv.DictReader(bgen_index, delimiter='\t')
-        bgen_dict: Dict[str, BGENInformation] = dict()
-        for line in bgen_index_csv:
-            bgen_info: BGENInformation = {'index': dxpy.dxlink(line['bgen_index_dxid']),
-                                          'sample': dxpy.dxlink(line['sample_dxid']),
-                                          'bgen': dxpy.dxlink(line['bgen_dxid']),
-                                          'vep': dxpy.dxlink(line['vep_dxid']),
-                                          'vepidx': dxpy.dxlink(line['vep_index_dxid'])}
-            bgen_dict[line['chrom']] = bgen_info
+    # Build fresh dxlinks on every call so that a caller modifying the returned information (at any depth) cannot
+    # alter the cached index, which only holds immutable file IDs
+    bgen_dict: Dict[str, BGENInformation] = dict()
+    for chrom, index_id, sample_id, bgen_id, vep_id, vepidx_id in _load_bgen_index(bgen_index.get_id()):
+        bgen_dict[chrom] = {'index': dxpy.dxlink(index_id),
+                            'sample': dxpy.dxlink(sample_id),
+                            'bgen': dxpy.dxlink(bgen_id),
+                            'vep': dxpy.dxlink(vep_id),
+                            'vepidx': dxpy.dxlink(vepidx_id)}
 
     return bgen_dict
 
 
+@lru_cache(maxsize=None)
+def _load_bgen_index(bgen_index_id: str) -> Tuple[Tuple[str, str, str, str, str, str], ...]:
+    """Cached download and parse of a bgen index file for :func:`ingest_wes_bgen`
+
+    Only the file IDs are cached (as tuples, so they cannot be modified in place); :func:`ingest_wes_bgen` builds the
+    dxlinks from them. Call `_load_bgen_index.cache_clear()` if the index is expected to change during a run.
+
+    :param bgen_index_id: The DNANexus file ID (file-12345) of a TSV-format 'dictionary' of file paths
+    :return: A Tuple with one entry per chromosome of (chrom, bgen_index_dxid, sample_dxid, bgen_dxid, vep_dxid,
+        vep_index_dxid)
+    """
+
+    # Download the INDEX of bgen files:
+    dxpy.download_dxfile(bgen_index_id, "bgen_locs.tsv")
+
+    # and load it into a tuple:
+    with Path('bgen_locs.tsv').open('r') as bgen_locs_file:
+        bgen_index_csv = csv.reader(bgen_locs_file, delimiter='\t')
+
+        # Resolve column positions once from the header so each row can be read as a plain list
+        header = next(bgen_index_csv)
+        chrom_col = header.index('chrom')
+        index_col = header.index('bgen_index_dxid')
+        sample_col = header.index('sample_dxid')
+        bgen_col = header.index('bgen_dxid')
+        vep_col = header.index('vep_dxid')
+        vepidx_col = header.index('vep_index_dxid')
+
+        return tuple((line[chrom_col], line[index_col], line[sample_col], line[bgen_col], line[vep_col],
+                      line[vepidx_col]) for line in bgen_index_csv)
+
+
 def ingest_tarballs(association_tarballs: dxpy.DXFile) -> Tuple[bool, bool, List[str]]:
     """Download the collapsed gene masks generated by mrcepid-collapsevariants
 
@@ -154,8 +195,9 @@ def ingest_tarballs(association_tarballs: dxpy.DXFile) -> Tuple[bool, bool, List
     tar_files = []
 
     # association_tarballs likely to be a single tarball:
-    if '.tar.gz' in association_tarballs.describe()['name']:
-        tar_files.append(association_tarballs.describe()['id'])
+    association_tarballs_description = association_tarballs.describe()
+    if '.tar.gz' in association_tarballs_description['name']:
+        tar_files.append(association_tarballs_description['id'])
 
     # association_tarballs likely to be a list of tarballs:
     else:
@@ -165,25 +207,200 @@ def ingest_tarballs(association_tarballs: dxpy.DXFile) -> Tuple[bool, bool, List
                 association_tarball = association_tarball.rstrip()
                 tar_files.append(association_tarball)
 
-    # And then process them in order
+    # An empty list file has nothing to process (and ThreadUtility refuses to iterate over an empty pool)
+    if len(tar_files) == 0:
+        return is_snp_tar, is_gene_tar, tarball_prefixes
+
+    # And then process them. Each tarball is independent, so download and extract them concurrently. Results come
+    # back in the order they finish, so they are keyed on the file ID and put back into the order of tar_files.
+    # Deduplicate so a listed tarball isn't downloaded into the same path twice, and cap the number of concurrent
+    # streams so that a long list doesn't open one connection (and read buffer) per core.
+    unique_tar_files = list(dict.fromkeys(tar_files))
+    thread_utility = ThreadUtility(threads=min(8, len(unique_tar_files)),
+                                   error_message='An association tarball download / extraction thread failed')
+    for tar_file in unique_tar_files:
+        thread_utility.launch_job(_ingest_tarball, tar_file=tar_file)
+
+    tarball_results = {tar_file: (tarball_prefix, is_snp, is_gene)
+                       for tar_file, tarball_prefix, is_snp, is_gene in thread_utility}
+
     for tar_file in tar_files:
-        current_tar = download_dxfile_by_name(tar_file, print_status=False)
-        if tarfile.is_tarfile(current_tar):
-            tarball_prefix = current_tar.name.replace('.tar.gz', '')
-            tarball_prefixes.append(tarball_prefix)
-            tar = tarfile.open(current_tar, 'r:gz')
-            tar.extractall()
+        tarball_prefix, is_snp, is_gene = tarball_results[tar_file]
+        tarball_prefixes.append(tarball_prefix)
+        is_snp_tar = is_snp_tar or is_snp
+        is_gene_tar = is_gene_tar or is_gene
 
-            if Path(f'{tarball_prefix}.SNP.BOLT.bgen').exists():
-                is_snp_tar = True
-            elif Path(f'{tarball_prefix}.GENE.BOLT.bgen').exists():
-                is_gene_tar = True
+    return is_snp_tar, is_gene_tar, tarball_prefixes
 
-        else:
+
+def _ingest_tarball(tar_file: str) -> Tuple[str, str, bool, bool]:
+    """Stream and extract a single tarball generated by mrcepid-collapsevariants
+
+    This is a helper for :func:`ingest_tarballs` so that multiple tarballs can be processed in parallel. The tarball is
+    read directly from DNANexus and extracted as it arrives, rather than first being downloaded in full and then read
+    back off disk, so network transfer and decompression overlap and the .tar.gz itself is never written locally.
+
+    dxpy prefetches several chunks of up to `read_buffer_size` per open file, and its default for that (96 MiB on a
+    worker) would let a handful of concurrent streams exhaust memory, so a 4 MiB buffer is requested instead. Together
+    with :func:`ingest_tarballs` running at most 8 streams at once, this keeps prefetched data to a small, bounded
+    amount. The streamed bytes are checked against the md5s recorded by DNANexus (see :class:`_MD5Reader`), as
+    :func:`dxpy.download_dxfile` would do for a download to disk; tarfile does not check the gzip CRC, so without this
+    a corrupted transfer could be extracted without error.
+
+    :param tar_file: A DXFile ID (file-12345...) pointing to a tar.gz file generated by mrcepid-collapsevariants
+    :return: A Tuple consisting of the provided tar_file, the prefix of the tarball, and if the tarball contains SNP-
+        or GENE-based masks
+    """
+
+    with dxpy.open_dxfile(tar_file, mode='rb', read_buffer_size=1 << 22) as dx_stream:
+        tarball_description = dx_stream.describe(fields={'name', 'parts', 'drive', 'md5'})
+        tar_stream = _MD5Reader(dx_stream, tar_file, tarball_description)
+        try:
+            tar = _open_tarball(tar_stream)
+        except tarfile.ReadError:
             raise dxpy.AppError(f'Provided association tarball ({tar_file}) '
                                 f'is not a tar.gz file')
+        # Errors past this point (e.g., a truncated tarball) are not about the file type, so let them propagate
+        tarball_members = set(_extract_tarball(tar))
+        tar_stream.verify()
 
-    return is_snp_tar, is_gene_tar, tarball_prefixes
+    tarball_prefix = tarball_description['name'].replace('.tar.gz', '')
+    is_snp = f'{tarball_prefix}.SNP.BOLT.bgen' in tarball_members
+    is_gene = not is_snp and f'{tarball_prefix}.GENE.BOLT.bgen' in tarball_members
+
+    return tar_file, tarball_prefix, is_snp, is_gene
+
+
+class _MD5Reader:
+    """A minimal read-only binary stream that checks the md5s of a DNANexus file as it is read through it
+
+    Regular DNANexus files have no md5 for the whole file, only one per uploaded part. As in
+    :func:`dxpy.download_dxfile`, parts are taken in order of their integer part ID, and each part's md5 is checked as
+    soon as its last byte has been read. Symlinked files (those with a 'drive') have no parts, so the whole-file md5
+    is checked by :meth:`verify` instead, when DNANexus has one.
+
+    :param stream: A readable binary stream of the file to wrap
+    :param file_id: The DNANexus file ID (file-12345) of the file, for error messages
+    :param description: A description of the file including the 'parts', 'drive', and 'md5' fields
+    """
+
+    def __init__(self, stream: BinaryIO, file_id: str, description: dict):
+        self._stream = stream
+        self._file_id = file_id
+
+        if 'drive' in description:
+            parts = {}
+            self._file_md5 = description.get('md5')
+        else:
+            parts = description['parts']
+            self._file_md5 = None
+        self._file_hasher = hashlib.md5()
+
+        # (part ID, size, md5) in the order the parts make up the file
+        self._parts = [(part_id, parts[part_id]['size'], parts[part_id].get('md5'))
+                       for part_id in sorted(parts, key=int)]
+        self._current_part = 0
+        self._part_remaining = self._parts[0][1] if self._parts else 0
+        self._part_hasher = hashlib.md5()
+        self._finish_parts()  # In case of leading empty parts
+
+    def read(self, size: int) -> bytes:
+        """Read up to size bytes from the wrapped stream, checking the md5 of any part completed by this read
+
+        :param size: The maximum number of bytes to read
+        :return: The bytes read
+        """
+
+        data = self._stream.read(size)
+        if self._file_md5 is not None:
+            self._file_hasher.update(data)
+
+        if self._parts:
+            remaining_data = memoryview(data)
+            while len(remaining_data) > 0:
+                if self._current_part == len(self._parts):
+                    raise dxpy.AppError(f'Provided file ({self._file_id}) is longer than its parts on DNANexus')
+                part_data = remaining_data[:self._part_remaining]
+                self._part_hasher.update(part_data)
+                self._part_remaining -= len(part_data)
+                remaining_data = remaining_data[len(part_data):]
+                self._finish_parts()
+
+        return data
+
+    def verify(self) -> None:
+        """Read the remainder of the wrapped stream and check that all of it matched DNANexus
+
+        tarfile stops reading at the end-of-archive marker, so any trailing padding and the gzip trailer still need to
+        be read before the last part (or the whole file) can be checked.
+
+        :return: None
+        """
+
+        while self.read(1 << 20):
+            pass
+
+        if self._current_part != len(self._parts):
+            raise dxpy.AppError(f'Provided file ({self._file_id}) is shorter than its parts on DNANexus')
+        if self._file_md5 is not None and self._file_hasher.hexdigest() != self._file_md5:
+            raise dxpy.AppError(f'Provided file ({self._file_id}) does not match its md5 on DNANexus')
+
+    def _finish_parts(self) -> None:
+        """Check the md5 of, and move past, every part that has been read in full
+
+        :return: None
+        """
+
+        while self._current_part < len(self._parts) and self._part_remaining == 0:
+            part_id, _, part_md5 = self._parts[self._current_part]
+            if part_md5 is not None and self._part_hasher.hexdigest() != part_md5:
+                raise dxpy.AppError(f'Provided file ({self._file_id}) does not match the md5 of part {part_id} on '
+                                    f'DNANexus')
+
+            self._current_part += 1
+            self._part_hasher = hashlib.md5()
+            if self._current_part < len(self._parts):
+                self._part_remaining = self._parts[self._current_part][1]
+
+
+def _open_tarball(tarball: Union[Path, BinaryIO]) -> tarfile.TarFile:
+    """Open a tar.gz file for extraction with :func:`_extract_tarball`
+
+    The tarball is opened in stream mode, so it is decompressed and extracted in a single forward pass rather than
+    first seeking through the gzip stream to index members. This also means the tarball can be provided as any
+    readable binary stream (e.g., a DXFile opened with :func:`dxpy.open_dxfile`) rather than only a local file. There
+    is no separate :func:`tarfile.is_tarfile` check; opening reads the first member header, so a file that is not a
+    tar.gz raises a :class:`tarfile.ReadError` here. Members are written out in 1 MiB chunks rather than tarfile's
+    default of 16 KiB, as collapsed mask tarballs can contain multi-GB bgen files.
+
+    :param tarball: A Path to a tar.gz file, or a readable binary stream of one
+    :return: An open :class:`tarfile.TarFile` in stream mode
+    """
+
+    if isinstance(tarball, Path):
+        return tarfile.open(tarball, 'r|gz', copybufsize=1 << 20)
+    else:
+        return tarfile.open(fileobj=tarball, mode='r|gz', copybufsize=1 << 20)
+
+
+def _extract_tarball(tar: tarfile.TarFile) -> List[str]:
+    """Extract a tarball opened by :func:`_open_tarball` into the current working directory and close it
+
+    Any error raised during extraction (e.g., a :class:`tarfile.ReadError` for a truncated tarball) is propagated, so
+    a partially extracted tarball is never mistaken for a complete one. Where the running Python supports extraction
+    filters, the 'data' filter is requested explicitly.
+
+    :param tar: An open :class:`tarfile.TarFile` from :func:`_open_tarball`
+    :return: A List of the names of all members extracted from the tarball
+    """
+
+    with tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(filter='data')
+        else:
+            tar.extractall()
+        # Members are recorded as they are extracted, so this does not re-read the archive
+        return tar.getnames()
 
 
 def process_regenie_step_one(regenie_run_location: dxpy.DXFile) -> bool:
@@ -197,7 +414,9 @@ def process_regenie_step_one(regenie_run_location: dxpy.DXFile) -> bool:
         return False
     else:
         tarball_path = download_dxfile_by_name(regenie_run_location)
-        if tarfile.is_tarfile(tarball_path):
-            tar = tarfile.open(tarball_path, 'r:gz')
-            tar.extractall()
+        try:
+            tar = _open_tarball(tarball_path)
+        except tarfile.ReadError:
+            return True  # Files that are not tarballs are not extracted, but the REGENIE run is still reported as found
+        _extract_tarball(tar)
         return True
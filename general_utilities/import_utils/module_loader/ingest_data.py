@@ -532,14 +532,9 @@ class IngestData(ABC):
             # lengthen the target list (e.g. 'write_fields')
             write_fields = write_fields + found_quantitative_covariates + found_categorical_covariates
 
-            # Open the final CSV writer
-            combo_writer = csv.DictWriter(final_covariates_writer,
-                                          fieldnames=write_fields,
-                                          quoting=csv.QUOTE_NONE,
-                                          delimiter=' ',
-                                          extrasaction='ignore',
-                                          lineterminator='\n')
-            combo_writer.writeheader()
+            # The final file is space-delimited with no quoting, so rows are formatted directly (see
+            # _format_covariate_row) rather than going through the general-purpose csv.DictWriter
+            final_covariates_writer.write(' '.join(write_fields) + '\n')
 
             num_all_samples = 0
             indv_written = 0  # Count the number of samples we will analyse
@@ -590,12 +585,12 @@ class IngestData(ABC):
                     if found_covars and found_phenos:
                         if sex == 2:
                             indv_written += 1
-                            combo_writer.writerow(indv_writer)
+                            final_covariates_writer.write(self._format_covariate_row(indv_writer, write_fields))
                             include_samples.write(f'{indv["eid"]} {indv["eid"]}\n')
                             include_samples_bcf.write(f'{indv["eid"]}\n')
                         elif sex == indv_writer['sex']:
                             indv_written += 1
-                            combo_writer.writerow(indv_writer)
+                            final_covariates_writer.write(self._format_covariate_row(indv_writer, write_fields))
                             include_samples.write(f'{indv["eid"]} {indv["eid"]}\n')
                             include_samples_bcf.write(f'{indv["eid"]}\n')
                         else:
@@ -612,3 +607,28 @@ class IngestData(ABC):
         self._logger.info(f'{"Samples with covariates after include/exclude lists applied":{65}}: {num_all_samples}')
         self._logger.info(f'{"Number of individuals WRITTEN to covariate/pheno file":{65}}: {indv_written}')
         self._logger.info(f'{"Number of individuals EXCLUDED from covariate/pheno file":{65}}: {indv_exclude}')
+
+    @staticmethod
+    def _format_covariate_row(indv_writer: Dict[str, Any], write_fields: List[str]) -> str:
+        """Format a single individual as a line of the final covariate + phenotype file
+
+        This matches the output of a csv.DictWriter with delimiter=' ', quoting=csv.QUOTE_NONE,
+        and extrasaction='ignore': fields are written in the order of write_fields, keys not in write_fields are
+        ignored, and missing / None values are written as an empty string. Like that writer (which has no escapechar),
+        a value containing a space, double quote, or newline cannot be written without shifting columns, so it raises
+        a csv.Error rather than being written.
+
+        :param indv_writer: Dictionary of field name -> value for this individual
+        :param write_fields: Ordered list of fields to write
+        :return: A space-delimited line (including the trailing newline) for this individual
+        :raises csv.Error: If any written value contains a space, double quote, or newline
+        """
+
+        values = (indv_writer.get(field) for field in write_fields)
+        row = ' '.join('' if value is None else str(value) for value in values)
+
+        # The only spaces allowed in the row are the len(write_fields) - 1 delimiters added by join()
+        if row.count(' ') != len(write_fields) - 1 or '"' in row or '\n' in row:
+            raise csv.Error('need to escape, but no escapechar set')
+
+        return row + '\n'
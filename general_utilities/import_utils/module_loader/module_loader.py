@@ -10,6 +10,12 @@ from abc import ABC, abstractmethod
 from general_utilities.mrc_logger import MRCLogger
 from general_utilities.import_utils.module_loader.association_pack import AssociationPack, ProgramArgs
 
+# Patterns used when parsing input arguments. These are compiled once at import, rather than on every call, as
+# _split_options() and dxfile_input() are run for every option / file provided to a module.
+DXFILE_ID_PATTERN = re.compile('file-\\w{24}')
+OPTION_PATTERN = re.compile('^(-{1,2}[\\w\\d-]+)\\s*([\\S\\s]+)?')
+QUOTE_PATTERN = re.compile('[\'\"]')
+
 
 class ModuleLoader(ABC):
     """An interface for loading individual modules and their parameters into the DNANexus environment.
@@ -85,7 +91,7 @@ class ModuleLoader(ABC):
                 return None
             else:
                 # First check if the input looks like a DXFile ID (must be 'file-' + 24 alphanumeric characters)
-                if re.match('file-\\w{24}', input_str):
+                if DXFILE_ID_PATTERN.match(input_str):
                     dxfile = dxpy.DXFile(dxid=input_str)
                     dxfile.describe()  # This will trigger Exceptions caught below if not actually a DXFile / not found
 
@@ -173,7 +179,7 @@ class ModuleLoader(ABC):
         parsed_args = []
         for arg in split_args:
 
-            opt_search = re.match('^(-{1,2}[\\w\\d-]+)\\s*([\\S\\s]+)?', arg)
+            opt_search = OPTION_PATTERN.match(arg)
 
             if opt_search:
                 parsed_args.append(opt_search.group(1))
@@ -184,7 +190,7 @@ class ModuleLoader(ABC):
                     # Strip any leading/lagging quotes from anything we parse:
                     str_len = len(group)
                     quote_match = 0
-                    for match in re.finditer('[\'\"]', group):
+                    for match in QUOTE_PATTERN.finditer(group):
                         if match.start() == 0:
                             quote_match += 1
                             group = group[1:len(group)]
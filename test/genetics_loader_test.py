@@ -0,0 +1,86 @@
+import pytest
+
+from pathlib import Path
+from general_utilities.mrc_logger import MRCLogger
+from general_utilities.import_utils.genetics_loader import GeneticsLoader
+
+
+def write_sample_file(sample_path: Path, samples: list) -> Path:
+    """Write a plink / bgen v1 format sample file for testing
+
+    :param sample_path: Where to write the sample file
+    :param samples: Sample IDs to write to the file (used for both ID_1 and ID_2)
+    :return: The path to the written sample file
+    """
+
+    with sample_path.open('w') as sample_file:
+        sample_file.write('ID_1 ID_2 missing sex\n')
+        sample_file.write('0 0 0 D\n')
+        for sample in samples:
+            sample_file.write(f'{sample} {sample} 0 NA\n')
+
+    return sample_path
+
+
+@pytest.mark.parametrize(
+    argnames=['samples'],
+    argvalues=zip([['1000001', '1000002', '1000003'], ['1000001'], []])
+)
+def test_generate_sample_set(tmp_path: Path, samples: list):
+    """Test that _generate_sample_set skips the two header lines and returns the ID_2 column of every other line
+
+    :param samples: Sample IDs to write to the test sample file
+    """
+
+    sample_path = write_sample_file(tmp_path / 'test.sample', samples)
+
+    assert GeneticsLoader._generate_sample_set(sample_path) == set(samples)
+
+
+def test_write_union_sample(tmp_path: Path, monkeypatch):
+    """Test that _write_union_sample writes the intersection of all provided sample files, regardless of the order
+    the files are provided in.
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    sample_paths = [write_sample_file(tmp_path / 'large.sample', [f'10000{i:02d}' for i in range(20)]),
+                    write_sample_file(tmp_path / 'small.sample', ['1000001', '1000005', '2000000']),
+                    write_sample_file(tmp_path / 'medium.sample', ['1000001', '1000002', '1000005', '1000009'])]
+
+    # _write_union_sample does not use any instance attributes, so we don't need to build a full GeneticsLoader
+    union_sample = GeneticsLoader._write_union_sample(GeneticsLoader.__new__(GeneticsLoader), sample_paths)
+
+    with union_sample.open('r') as union_file:
+        assert union_file.readline() == 'ID_1 ID_2\n'
+        assert union_file.readline() == '0 0\n'
+        assert sorted(union_file.readlines()) == ['1000001 1000001\n', '1000005 1000005\n']
+
+
+def test_synchronise_genetic_data(tmp_path: Path, monkeypatch):
+    """Test that _synchronise_genetic_data restricts the include, remove, and covariate files to samples found in both
+    the union sample file and SAMPLES_Include.txt.
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    union_sample = write_sample_file(tmp_path / 'union.sample', ['1000001', '1000002', '1000003', '1000004'])
+    with Path('SAMPLES_Include.txt').open('w') as include_file:
+        for sample in ['1000002', '1000003', '1000004', '1000005']:
+            include_file.write(f'{sample} {sample}\n')
+    with Path('phenotypes_covariates.formatted.txt').open('w') as combo_file:
+        combo_file.write('FID IID age pheno\n')
+        for sample in ['1000002', '1000003', '1000004', '1000005']:
+            combo_file.write(f'{sample} {sample} 50 NA\n')
+
+    genetics_loader = GeneticsLoader.__new__(GeneticsLoader)
+    genetics_loader._logger = MRCLogger(__name__).get_logger()
+    genetics_loader._union_sample = union_sample
+    genetics_loader._synchronise_genetic_data()
+
+    assert Path('SAMPLES_Include.txt').read_text() == '1000002 1000002\n1000003 1000003\n1000004 1000004\n'
+    assert Path('SAMPLES_Remove.txt').read_text() == '1000001 1000001\n'
+    assert Path('phenotypes_covariates.formatted.txt').read_text() == 'FID IID age pheno\n' \
+                                                                      '1000002 1000002 50 NA\n' \
+                                                                      '1000003 1000003 50 NA\n' \
+                                                                      '1000004 1000004 50 NA\n'
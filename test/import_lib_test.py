@@ -0,0 +1,296 @@
+import io
+import os
+import hashlib
+import time
+import dxpy
+import pytest
+import tarfile
+
+from pathlib import Path
+from general_utilities.import_utils import import_lib
+from general_utilities.import_utils.import_lib import process_bgen_file, sample_v2_to_v1, ingest_wes_bgen, \
+    ingest_tarballs, _ingest_tarball, _load_bgen_index, _open_tarball, _extract_tarball
+
+
+def test_process_bgen_file(tmp_path: Path, monkeypatch):
+    """Test that process_bgen_file describes its files in one call and gives each download its own description, even
+    when descriptions come back in a different order to the one requested
+    """
+
+    monkeypatch.chdir(tmp_path)
+    Path('filtered_bgen/').mkdir()
+
+    chrom_bgen_index = {'index': dxpy.dxlink('file-index'),
+                        'sample': dxpy.dxlink('file-sample'),
+                        'bgen': dxpy.dxlink({'id': 'file-bgen', 'project': 'project-test'}),
+                        'vep': dxpy.dxlink('file-vep'),
+                        'vepidx': dxpy.dxlink('file-vepidx')}
+
+    described = []
+
+    def mock_describe(dxlinks: list, fields: list):
+        described.append([dxpy.get_dxlink_ids(dxlink)[0] for dxlink in dxlinks])
+        return [{'id': file_id, 'parts': {'1': {'size': 0}}} for file_id in reversed(described[-1])]
+
+    downloaded = {}
+
+    def mock_download_dxfile(dxid: dict, filename: str, describe_output: dict):
+        downloaded[filename] = (dxpy.get_dxlink_ids(dxid)[0], describe_output['id'])
+        with Path(filename).open('w') as downloaded_file:
+            if filename.endswith('.sample'):
+                downloaded_file.write('ID missing sex\n0 0 D\n1000001 0 NA\n')
+
+    monkeypatch.setattr(import_lib.dxpy, 'describe', mock_describe)
+    monkeypatch.setattr(import_lib.dxpy, 'download_dxfile', mock_download_dxfile)
+
+    process_bgen_file(chrom_bgen_index, 'chr1')
+
+    assert described == [['file-index', 'file-sample', 'file-bgen', 'file-vep']]
+    assert downloaded == {'filtered_bgen/chr1.filtered.bgen.bgi': ('file-index', 'file-index'),
+                          'filtered_bgen/chr1.filtered.sample': ('file-sample', 'file-sample'),
+                          'filtered_bgen/chr1.filtered.bgen': ('file-bgen', 'file-bgen'),
+                          'filtered_bgen/chr1.filtered.vep.tsv.gz': ('file-vep', 'file-vep')}
+    assert Path('filtered_bgen/chr1.filtered.sample').read_text() == \
+           'ID_1 ID_2 missing sex\n0 0 0 D\n1000001 1000001 0 NA\n'
+
+
+@pytest.mark.parametrize(
+    argnames=['header', 'samples'],
+    argvalues=zip(['ID missing sex\n0 0 D\n', 'ID_1 ID_2 missing\n0 0 0\n', 'ID missing sex\n0 0 D\n'],
+                  [['1000001', '1000002', '1000003'], ['1000001', '1000002'], []])
+)
+def test_sample_v2_to_v1(tmp_path: Path, header: str, samples: list):
+    """Test that sample_v2_to_v1 rewrites both possible v2 headers to a v1 header and duplicates the ID column
+
+    :param header: The first two lines of the v2 sample file
+    :param samples: Sample IDs to write to the v2 sample file
+    """
+
+    bgen_v2 = tmp_path / 'test.sample'
+    with bgen_v2.open('w') as sample_file:
+        sample_file.write(header)
+        for sample in samples:
+            sample_file.write(f'{sample} 0 NA\n')
+
+    bgen_v1 = sample_v2_to_v1(bgen_v2)
+
+    assert bgen_v1 == bgen_v2
+    assert bgen_v1.read_text() == 'ID_1 ID_2 missing sex\n0 0 0 D\n' + \
+           ''.join(f'{sample} {sample} 0 NA\n' for sample in samples)
+
+
+@pytest.mark.parametrize(
+    argnames=['contents'],
+    argvalues=zip(['', '1000001 0 NA\n', 'ID missing sex\n1000001 0 NA\n'])
+)
+def test_sample_v2_to_v1_bad_header(tmp_path: Path, contents: str):
+    """Test that sample_v2_to_v1 refuses to convert files without the two v2 header lines
+
+    :param contents: The complete contents of the malformed sample file
+    """
+
+    bgen_v2 = tmp_path / 'test.sample'
+    bgen_v2.write_text(contents)
+
+    with pytest.raises(dxpy.AppError):
+        sample_v2_to_v1(bgen_v2)
+
+
+@pytest.mark.parametrize(
+    argnames=['as_stream'],
+    argvalues=zip([False, True])
+)
+def test_extract_tarball(tmp_path: Path, monkeypatch, as_stream: bool):
+    """Test that _extract_tarball extracts into the current directory and returns member names, that _open_tarball
+    rejects non-tarballs, and that a truncated tarball opens but raises during extraction
+
+    :param as_stream: Provide the tarball as an open binary stream rather than a Path
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    tarball_path = tmp_path / 'test_mask.tar.gz'
+    members = ['test_mask.SNP.BOLT.bgen', 'test_mask.SNP.STAAR.matrix.rds']
+    with tarfile.open(tarball_path, 'w:gz') as tar:
+        for member in members:
+            tar_info = tarfile.TarInfo(member)
+            tar_info.size = len(member)
+            tar.addfile(tar_info, io.BytesIO(member.encode()))
+
+    if as_stream:
+        with tarball_path.open('rb') as tarball_stream:
+            assert _extract_tarball(_open_tarball(tarball_stream)) == members
+    else:
+        assert _extract_tarball(_open_tarball(tarball_path)) == members
+    for member in members:
+        assert (tmp_path / member).read_text() == member
+
+    not_tarball = tmp_path / 'not_a_tarball.txt'
+    not_tarball.write_text('file-1234567890ABCDEFGHIJKL\n')
+    with pytest.raises(tarfile.ReadError):
+        _open_tarball(not_tarball)
+
+    # Incompressible member contents so that cutting the compressed tarball in half truncates member data
+    truncated_path = tmp_path / 'truncated_mask.tar.gz'
+    with tarfile.open(truncated_path, 'w:gz') as tar:
+        for member in members:
+            contents = os.urandom(1 << 16)
+            tar_info = tarfile.TarInfo(member)
+            tar_info.size = len(contents)
+            tar.addfile(tar_info, io.BytesIO(contents))
+    truncated_bytes = truncated_path.read_bytes()
+    truncated_path.write_bytes(truncated_bytes[:len(truncated_bytes) // 2])
+
+    with truncated_path.open('rb') as truncated_stream:
+        truncated_tar = _open_tarball(truncated_stream if as_stream else truncated_path)
+        with pytest.raises(tarfile.ReadError):
+            _extract_tarball(truncated_tar)
+
+
+class MockTarballList:
+    """A stand-in for a DXFile pointing to a list of association tarballs, as only describe() is used"""
+
+    def describe(self) -> dict:
+        return {'id': 'file-tarball_list', 'name': 'tarball_list.txt'}
+
+
+@pytest.mark.parametrize(
+    argnames=['tar_files', 'expected'],
+    argvalues=zip([['file-snp_slow', 'file-gene_fast', 'file-none', 'file-snp_slow'],
+                   ['file-none', 'file-gene_fast'],
+                   []],
+                  [(True, True, ['snp_slow', 'gene_fast', 'none', 'snp_slow']),
+                   (False, True, ['none', 'gene_fast']),
+                   (False, False, [])])
+)
+def test_ingest_tarballs(tmp_path: Path, monkeypatch, tar_files: list, expected: tuple):
+    """Test that ingest_tarballs processes each listed tarball once and reports prefixes in list order
+
+    Tarballs are 'extracted' by a mock that finishes the first-listed tarball last, so results arrive out of order.
+
+    :param tar_files: DXFile IDs written to the tarball list file, possibly including duplicates
+    :param expected: The expected return of ingest_tarballs
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    tarball_list = tmp_path / 'tarball_list.txt'
+    tarball_list.write_text(''.join(f'{tar_file}\n' for tar_file in tar_files))
+    monkeypatch.setattr(import_lib, 'download_dxfile_by_name', lambda dxfile, print_status: tarball_list)
+
+    ingested = []
+
+    def mock_ingest_tarball(tar_file: str):
+        ingested.append(tar_file)
+        if tar_file == 'file-snp_slow':
+            time.sleep(0.2)
+        tarball_prefix = tar_file.replace('file-', '')
+        return tar_file, tarball_prefix, tarball_prefix.startswith('snp'), tarball_prefix.startswith('gene')
+
+    monkeypatch.setattr(import_lib, '_ingest_tarball', mock_ingest_tarball)
+
+    assert ingest_tarballs(MockTarballList()) == expected
+    assert sorted(ingested) == sorted(set(tar_files))
+
+
+def test_ingest_wes_bgen_cached(tmp_path: Path, monkeypatch):
+    """Test that ingest_wes_bgen only downloads a given bgen index once, and that modifying the returned information
+    does not alter what later calls return
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    downloaded = []
+
+    def mock_download_dxfile(dxid: str, filename: str):
+        downloaded.append(dxid)
+        Path(filename).write_text('chrom\tvep_dxid\tvep_index_dxid\tbgen_dxid\tbgen_index_dxid\tsample_dxid\n'
+                                  'chr1\tfile-vep\tfile-vepidx\tfile-bgen\tfile-index\tfile-sample\n')
+
+    monkeypatch.setattr(import_lib.dxpy, 'download_dxfile', mock_download_dxfile)
+
+    bgen_index_id = 'file-' + 'Z' * 24
+    _load_bgen_index.cache_clear()
+    try:
+        first_index = ingest_wes_bgen(dxpy.DXFile(bgen_index_id))
+        first_index['chr1']['bgen']['$dnanexus_link'] = 'file-modified'
+        second_index = ingest_wes_bgen(dxpy.DXFile(bgen_index_id))
+    finally:
+        _load_bgen_index.cache_clear()
+
+    assert downloaded == [bgen_index_id]
+    assert second_index == {'chr1': {'index': dxpy.dxlink('file-index'),
+                                     'sample': dxpy.dxlink('file-sample'),
+                                     'bgen': dxpy.dxlink('file-bgen'),
+                                     'vep': dxpy.dxlink('file-vep'),
+                                     'vepidx': dxpy.dxlink('file-vepidx')}}
+
+
+class MockDXStream(io.BytesIO):
+    """A stand-in for a DXFile opened with dxpy.open_dxfile, as only read() and describe() are used"""
+
+    def __init__(self, contents: bytes, description: dict):
+        super().__init__(contents)
+        self._description = description
+
+    def describe(self, fields: set) -> dict:
+        return {field: self._description[field] for field in fields if field in self._description}
+
+
+@pytest.mark.parametrize(
+    argnames=['md5_status'],
+    argvalues=zip(['match', 'part_mismatch', 'truncated', 'symlink_match', 'symlink_mismatch'])
+)
+def test_ingest_tarball(tmp_path: Path, monkeypatch, md5_status: str):
+    """Test that _ingest_tarball streams with a small read buffer, extracts, and checks the md5 of each part (or of the
+    whole file, for symlinks) recorded by DNANexus
+
+    :param md5_status: Whether the md5s reported by DNANexus match the tarball, and if the file is a symlink
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    # Incompressible member contents so that the tarball spans several reads and parts
+    tarball = io.BytesIO()
+    with tarfile.open(fileobj=tarball, mode='w:gz') as tar:
+        for member, size in [('test_mask.GENE.BOLT.bgen', 1 << 16), ('test_mask.GENE.STAAR.matrix.rds', 1 << 10)]:
+            contents = os.urandom(size)
+            tar_info = tarfile.TarInfo(member)
+            tar_info.size = len(contents)
+            tar.addfile(tar_info, io.BytesIO(contents))
+    tarball_bytes = tarball.getvalue()
+
+    # Part IDs are ordered as integers, so '10' must be read after '2'; listed out of order on purpose
+    part_size = len(tarball_bytes) // 3
+    part_bytes = {'1': tarball_bytes[:part_size],
+                  '2': tarball_bytes[part_size:2 * part_size],
+                  '10': tarball_bytes[2 * part_size:]}
+    parts = {part_id: {'size': len(part_bytes[part_id]), 'md5': hashlib.md5(part_bytes[part_id]).hexdigest()}
+             for part_id in ['10', '2', '1']}
+
+    if md5_status == 'part_mismatch':
+        parts['2']['md5'] = hashlib.md5(b'not the tarball').hexdigest()
+    elif md5_status == 'truncated':
+        parts['11'] = {'size': 1 << 10, 'md5': hashlib.md5(b'').hexdigest()}
+
+    if md5_status.startswith('symlink'):
+        md5 = hashlib.md5(tarball_bytes if md5_status == 'symlink_match' else b'not the tarball').hexdigest()
+        description = {'name': 'test_mask.tar.gz', 'drive': 'drive-test', 'md5': md5}
+    else:
+        description = {'name': 'test_mask.tar.gz', 'parts': parts}
+
+    read_buffer_sizes = []
+
+    def mock_open_dxfile(dxid: str, mode: str, read_buffer_size: int):
+        read_buffer_sizes.append(read_buffer_size)
+        return MockDXStream(tarball_bytes, description)
+
+    monkeypatch.setattr(import_lib.dxpy, 'open_dxfile', mock_open_dxfile)
+
+    if md5_status in ['match', 'symlink_match']:
+        assert _ingest_tarball('file-test_mask') == ('file-test_mask', 'test_mask', False, True)
+        assert (tmp_path / 'test_mask.GENE.BOLT.bgen').exists()
+    else:
+        with pytest.raises(dxpy.AppError):
+            _ingest_tarball('file-test_mask')
+    assert read_buffer_sizes == [1 << 22]
@@ -0,0 +1,55 @@
+import csv
+import io
+import pytest
+
+from general_utilities.import_utils.module_loader.ingest_data import IngestData
+
+write_fields = ['FID', 'IID', 'sex', 'pheno', 'PC1']
+
+
+def dict_writer_row(indv_writer: dict) -> str:
+    """Format a row with the csv.DictWriter that IngestData._format_covariate_row replaces
+
+    :param indv_writer: Dictionary of field name -> value for this individual
+    :return: The line written by csv.DictWriter for this individual
+    """
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, delimiter=' ', fieldnames=write_fields, quoting=csv.QUOTE_NONE,
+                            extrasaction='ignore', lineterminator='\n')
+    writer.writerow(indv_writer)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize(
+    argnames=['indv_writer'],
+    argvalues=zip([{'FID': '1000001', 'IID': '1000001', 'sex': 1, 'pheno': 0.25, 'PC1': -1.5},
+                   {'FID': '1000001', 'IID': '1000001', 'sex': 0, 'pheno': None, 'PC1': 1e-05},
+                   {'FID': '1000001', 'IID': '1000001', 'sex': 0, 'PC1': 2.0},
+                   {'FID': '1000001', 'IID': '1000001', 'sex': 1, 'pheno': 'NA', 'PC1': '', 'batch': 'b1'}])
+)
+def test_format_covariate_row(indv_writer: dict):
+    """Test that _format_covariate_row writes the same line as csv.DictWriter for None, missing, extra and float values
+
+    :param indv_writer: Dictionary of field name -> value for this individual
+    """
+
+    assert IngestData._format_covariate_row(indv_writer, write_fields) == dict_writer_row(indv_writer)
+
+
+@pytest.mark.parametrize(
+    argnames=['value'],
+    argvalues=zip(['batch 1', 'batch"1', 'batch\n1'])
+)
+def test_format_covariate_row_needs_escape(value: str):
+    """Test that _format_covariate_row refuses values that csv.DictWriter could not write without an escapechar
+
+    :param value: A covariate value containing a delimiter, quote, or line terminator
+    """
+
+    indv_writer = {'FID': '1000001', 'IID': '1000001', 'sex': 1, 'pheno': 0.25, 'PC1': value}
+
+    with pytest.raises(csv.Error):
+        dict_writer_row(indv_writer)
+    with pytest.raises(csv.Error):
+        IngestData._format_covariate_row(indv_writer, write_fields)